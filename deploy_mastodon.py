@@ -1,13 +1,24 @@
 #!/usr/bin/env python
 
+import asyncio
+import io
 import os
 import re
+import sys
 import subprocess
 import datetime
-import glob
+import functools
 import shutil
 import argparse
 import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor, wait
+
+# Optional. If available, read-only git queries are answered in-process
+# instead of spawning git.
+try:
+	import pygit2
+except ImportError:
+	pygit2 = None
 
 ROOT_PATH = '.'
 PATH_TO_POM_FILE = os.path.join( ROOT_PATH, 'pom.xml' )
@@ -30,113 +41,375 @@ EXTRAS = [
 	'humble-video-noarch' ]
 # Path to where the repos are cloned on your computer.
 REPO_RELATIVE_PATH = '..'
-
-def run_command( cmd, where, debug=False ):
+REPO_ABS = os.path.realpath( os.path.join( ROOT_PATH, REPO_RELATIVE_PATH ) )
+
+# Patterns used to parse the output of git status.
+_BRANCH_RE = re.compile( r"^On branch (.+)$", re.MULTILINE )
+_DETACHED_RE = re.compile( r"^HEAD detached at (.+)$", re.MULTILINE )
+_UPTODATE_BRANCH_RE = re.compile( r"Your branch is up to date with", re.MULTILINE )
+_NOTHING_COMMIT_RE = re.compile( r"nothing to commit", re.MULTILINE )
+_UNSTAGED_RE = re.compile( r"Changes not staged for commit:", re.MULTILINE )
+# What pygit2 needs to name a detached HEAD the way git status does: the
+# HEAD reflog message of a checkout, and the rules git uses to expand a
+# short ref name.
+_CHECKOUT_RE = re.compile( r"^checkout: moving from .*? to (.+)$" )
+_REF_RULES = ( '%s', 'refs/%s', 'refs/tags/%s', 'refs/heads/%s', 'refs/remotes/%s', 'refs/remotes/%s/HEAD' )
+
+# Branch or tag each artifact repo is on, as far as we know. Filled by
+# check_if_clean() and kept up to date by the checkouts, so that we do not
+# have to ask git again.
+_branch_cache = {}
+
+def artifact_path( artifact ):
+	return os.path.join( REPO_ABS, artifact )
+
+def _argv( cmd ):
+	# Resolve the executable ourselves so that wrappers like mvn.cmd are
+	# found on Windows too.
+	return [ shutil.which( cmd[ 0 ] ) or cmd[ 0 ] ] + cmd[ 1: ]
+
+def run_command( cmd, where, debug=False, stream=False, need_output=True ):
+	"""Runs the command given as a list of arguments in the folder where,
+	without going through a shell. Returns whether it succeeded, and its
+	output. If stream is True, the output, or the error if the command
+	cannot be started, is printed as it comes instead, and if need_output
+	is False it is discarded. In both cases an empty string is returned in
+	its place."""
 	if debug:
-		print( '  Running %s on %s' % ( cmd, where ) )
+		print( '  Running %s on %s' % ( ' '.join( cmd ), where ) )
+	try:
+		if not need_output:
+			result = subprocess.run( _argv( cmd ), cwd = where,
+				stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL, check = False )
+			return result.returncode == 0, ''
+		if stream:
+			with subprocess.Popen( _argv( cmd ), cwd = where,
+					stdout = subprocess.PIPE, stderr = subprocess.STDOUT, bufsize = 1,
+					text = True, encoding = 'ISO-8859-1' ) as proc:
+				for line in proc.stdout:
+					sys.stdout.write( line )
+			return proc.returncode == 0, ''
+		result = subprocess.run( _argv( cmd ), cwd = where,
+			stdout = subprocess.PIPE, stderr = subprocess.STDOUT,
+			text = True, encoding = 'ISO-8859-1', check = False )
+	except OSError as e:
+		if stream:
+			print( e )
+			return False, ''
+		return False, str( e )
+	return result.returncode == 0, result.stdout
+
+async def _let_finish( coro ):
+	"""Awaits coro, which runs a git or maven command, in a task of its own.
+	If we get cancelled meanwhile, the command is still awaited until it is
+	done before the cancellation goes on: killing git could leave a stale
+	index.lock or a half-updated work tree behind."""
+	job = asyncio.ensure_future( coro )
 	try:
-		out = subprocess.check_output( cmd, cwd = where, shell = True, stderr = subprocess.STDOUT )
-		return True, out.decode('ISO-8859-1')
-	except subprocess.CalledProcessError as e:
-		return False, e.output.decode('ISO-8859-1')
+		return await asyncio.shield( job )
+	except asyncio.CancelledError:
+		await asyncio.wait( [ job ] )
+		raise
+
+async def run_command_async( cmd, where, debug=False, stream=False, need_output=True ):
+	"""Same as run_command(), for use in coroutines. If the coroutine is
+	cancelled, it waits for the command to finish first."""
+	if debug:
+		print( '  Running %s on %s' % ( ' '.join( cmd ), where ) )
+	return await _let_finish( _run_command_async( cmd, where, stream, need_output ) )
+
+async def _run_command_async( cmd, where, stream, need_output ):
+	if need_output:
+		stdout, stderr = asyncio.subprocess.PIPE, asyncio.subprocess.STDOUT
+	else:
+		stdout, stderr = asyncio.subprocess.DEVNULL, asyncio.subprocess.DEVNULL
+	try:
+		proc = await asyncio.create_subprocess_exec( *_argv( cmd ), cwd = where,
+			stdout = stdout, stderr = stderr )
+	except OSError as e:
+		if stream:
+			print( e )
+			return False, ''
+		return False, str( e )
+	if not need_output:
+		await proc.wait()
+		return proc.returncode == 0, ''
+	if stream:
+		async for line in proc.stdout:
+			sys.stdout.write( line.decode( 'ISO-8859-1' ) )
+		await proc.wait()
+		return proc.returncode == 0, ''
+	out, _ = await proc.communicate()
+	return proc.returncode == 0, out.decode( 'ISO-8859-1' )
+
+@functools.lru_cache( maxsize = 1 )
+def _load_versions():
+	"""Reads the pom once and returns a dict mapping each artifact name to
+	the version declared for it in the properties section."""
+	versions = {}
+	with open( PATH_TO_POM_FILE, 'rb' ) as pom_file:
+		for event, element in ET.iterparse( pom_file, events = ( 'end', ) ):
+			# Strip the maven namespace from the tag.
+			if element.tag.split( '}' )[ -1 ] != 'properties':
+				continue
+			for child in element:
+				name = child.tag.split( '}' )[ -1 ]
+				if name.endswith( '.version' ):
+					versions[ name[ :-len( '.version' ) ] ] = ( child.text or '' ).strip()
+			element.clear()
+			break
+	return versions
 
 def get_artifact_version( artifact_name ):
-	"""Reads the module version in the pom by looking at the dependencies
-	section."""
-
-	# For the version of the other ones, they are set as a dep.
-	regex = ( u"\<" + artifact_name + "\.version\>(.+)\</" + artifact_name + "\.version\>")
-	with open( PATH_TO_POM_FILE, 'r' ) as pom_file:
-		matches = re.finditer(regex, pom_file.read(), re.MULTILINE)
-		for matchNum, match in enumerate(matches, start=1):
-			return match.group(1)
-	return ""
-
-def check_if_clean( artifact, skip_up_to_date, skip_unstaged ):
-	print( 'Checking repo %s ' % artifact )
-	path = os.path.join( ROOT_PATH, REPO_RELATIVE_PATH, artifact )
-	path = os.path.realpath( path )
-	ok, out = run_command( "git status -uno", path )
+	"""Returns the module version specified in the pom, or an empty string
+	if it is not there."""
+	return _load_versions().get( artifact_name, "" )
+
+def _checkout_target_name( repo, target, commit_id ):
+	"""Returns the name git status shows for a checkout of target that
+	moved HEAD to commit_id: the ref target stands for, if it is
+	unambiguous and still points at that commit, or the short hash."""
+	if target != 'HEAD':
+		found = []
+		for rule in _REF_RULES:
+			try:
+				ref = repo.references.get( rule % target )
+			except ValueError:
+				continue # Not a valid ref name.
+			if ref is not None:
+				found.append( ref )
+		if len( found ) == 1:
+			try:
+				if found[ 0 ].peel( pygit2.Commit ).id == commit_id:
+					name = found[ 0 ].name
+					for prefix in ( 'refs/tags/', 'refs/remotes/' ):
+						if name.startswith( prefix ):
+							return name[ len( prefix ): ]
+					return name
+			except ( pygit2.GitError, ValueError ):
+				pass # Does not point at a commit.
+	return repo[ commit_id ].short_id
+
+def _detached_head_name( repo ):
+	"""Returns the name git status gives to the detached HEAD of the repo,
+	taken from the last checkout recorded in the HEAD reflog. Returns None
+	when git status would not print 'HEAD detached at': if HEAD moved since
+	that checkout, or if there is none."""
+	head = repo.head.target
+	for entry in repo.references[ 'HEAD' ].log():
+		match = _CHECKOUT_RE.match( entry.message or '' )
+		if match is None:
+			continue
+		if entry.oid_new != head:
+			return None # 'HEAD detached from'.
+		return _checkout_target_name( repo, match.group( 1 ), entry.oid_new )
+	return None
+
+def _read_git_status_pygit2( path ):
+	"""Same as read_git_status(), using libgit2 instead of git status."""
+	try:
+		repo = pygit2.Repository( path )
+		status = { 'branch' : None, 'tag' : None, 'up_to_date' : False, 'unstaged' : False }
+		try:
+			files = repo.status( untracked_files = 'no' )
+		except TypeError:
+			files = repo.status() # Older pygit2.
+		flags = 0
+		for file_flags in files.values():
+			flags |= file_flags
+		# Equivalent of -uno.
+		flags &= ~( pygit2.GIT_STATUS_WT_NEW | pygit2.GIT_STATUS_IGNORED )
+		status[ 'unstaged' ] = bool( flags & ( pygit2.GIT_STATUS_WT_MODIFIED | pygit2.GIT_STATUS_WT_DELETED
+			| pygit2.GIT_STATUS_WT_TYPECHANGE | pygit2.GIT_STATUS_WT_RENAMED ) )
+		if repo.head_is_detached:
+			status[ 'tag' ] = _detached_head_name( repo )
+			# For a detached head, being up to date means having no changes.
+			status[ 'up_to_date' ] = status[ 'tag' ] is not None and flags == 0
+		else:
+			branch = repo.branches.local[ repo.head.shorthand ]
+			status[ 'branch' ] = branch.branch_name
+			upstream = branch.upstream
+			status[ 'up_to_date' ] = upstream is not None and upstream.target == repo.head.target
+		return True, status
+	except ( pygit2.GitError, KeyError ) as e:
+		return False, str( e )
+
+async def read_git_status( path ):
+	"""Runs 'git status -uno' in the repo at path and scans its output line
+	by line, stopping as soon as we know everything we need. Returns ok
+	and a dict with the current 'branch' or detached 'tag', whether the repo
+	is 'up_to_date' and whether it has 'unstaged' changes. If git fails,
+	returns False and its output instead."""
+	if pygit2 is not None:
+		# libgit2 calls block, so run them in a thread to keep the repos
+		# checked concurrently.
+		return await asyncio.to_thread( _read_git_status_pygit2, path )
+	return await _let_finish( _scan_git_status( path ) )
+
+async def _scan_git_status( path ):
+	try:
+		proc = await asyncio.create_subprocess_exec( 'git', 'status', '-uno', cwd = path,
+			stdout = asyncio.subprocess.PIPE, stderr = asyncio.subprocess.STDOUT )
+	except OSError as e:
+		return False, str( e )
+
+	status = { 'branch' : None, 'tag' : None, 'up_to_date' : False, 'unstaged' : False }
+	lines = []
+	done = False
+	async for line in proc.stdout:
+		line = line.decode( 'ISO-8859-1' ).rstrip( '\n' )
+		lines.append( line )
+		branch_match = _BRANCH_RE.search( line )
+		tag_match = _DETACHED_RE.search( line )
+		if branch_match is not None:
+			status[ 'branch' ] = branch_match.group( 1 )
+		elif tag_match is not None:
+			status[ 'tag' ] = tag_match.group( 1 )
+		elif _UPTODATE_BRANCH_RE.search( line ):
+			# Only meaningful when we are on a branch.
+			status[ 'up_to_date' ] = status[ 'branch' ] is not None
+		elif _NOTHING_COMMIT_RE.search( line ):
+			# For a detached head, being up to date means having no changes.
+			if status[ 'tag' ] is not None:
+				status[ 'up_to_date' ] = True
+			done = True
+		elif _UNSTAGED_RE.search( line ):
+			# Comes after the branch and remote lines.
+			status[ 'unstaged' ] = True
+			done = True
+		if done:
+			break
+	# Skip whatever git still prints without parsing it. Signalling git
+	# instead would race with it exiting on its own.
+	await proc.stdout.read()
+	await proc.wait()
+	if not done and proc.returncode != 0:
+		return False, '\n'.join( lines )
+	return True, status
+
+async def check_if_clean( artifact, skip_up_to_date, skip_unstaged, log = sys.stdout ):
+	print( 'Checking repo %s ' % artifact, file = log )
+	path = artifact_path( artifact )
+	ok, status = await read_git_status( path )
 	if not ok:
-		print('Could not get git status: %s' % out)
+		print('Could not get git status: %s' % status, file = log )
 		return False
 
-	# Get branch name.
-	branch_match = re.search( u"^On branch (.+)$", out, re.MULTILINE )
-	if branch_match is not None:
-		print( '  Current branch: %s' % branch_match.group( 1 ) )
-		# Check if we are up to date.
-		up_to_date = re.search( u"Your branch is up to date with", out, re.MULTILINE )
+	if status[ 'branch' ] is not None:
+		print( '  Current branch: %s' % status[ 'branch' ], file = log )
+		_branch_cache[ artifact ] = status[ 'branch' ]
 	else:
-		tag_match = re.search( u"^HEAD detached at (.+)$", out, re.MULTILINE )
-		print( '  Current tag: %s' % tag_match.group( 1 ) )
-		# Check if we are up to date.
-		up_to_date = re.search( u"nothing to commit", out, re.MULTILINE )
+		print( '  Current tag: %s' % status[ 'tag' ], file = log )
+		_branch_cache[ artifact ] = status[ 'tag' ]
+	up_to_date = status[ 'up_to_date' ]
 
 	if not skip_up_to_date and not up_to_date:
-		print( '  Repo not up to date with remote. Aborting. ' )
+		print( '  Repo not up to date with remote. Aborting. ', file = log )
 		return False
 	# Check if there are unstaged commits.
-	unstaged = re.search( u"Changes not staged for commit:", out, re.MULTILINE )
-	if not skip_unstaged and unstaged:
-		print( '  There are unstaged changes. Aborting. ' )
+	if not skip_unstaged and status[ 'unstaged' ]:
+		print( '  There are unstaged changes. Aborting. ', file = log )
 		return False
 
-	print( '  All good.' )
+	print( '  All good.', file = log )
 	return True
 
 def git_pull( artifact ):
 	print( 'Pulling in repo %s' % artifact )
-	path = os.path.join( ROOT_PATH, REPO_RELATIVE_PATH, artifact )
-	path = os.path.realpath( path )
-	ok, out = run_command( "git pull", path )
+	path = artifact_path( artifact )
+	ok, out = run_command( [ "git", "pull" ], path, need_output = False )
 	return ok, out
 
-def git_checkout_master( artifact ):
-	path = os.path.join( ROOT_PATH, REPO_RELATIVE_PATH, artifact )
-	path = os.path.realpath( path )
-	ok, out = run_command( "git checkout master", path )
+async def git_checkout_master( artifact, log = sys.stdout ):
+	path = artifact_path( artifact )
+	ok, out = await run_command_async( [ "git", "checkout", "master" ], path )
 	if not ok:
-		print('  Could not checkout master branch: %s' % out)
+		print('  Could not checkout master branch: %s' % out, file = log )
 		return False
+	_branch_cache[ artifact ] = 'master'
 	return True
 
-def git_checkout_version( artifact, version, do_install ):
+def _rev_parse_head_and_tag_pygit2( path, tag ):
+	"""Same as _rev_parse_head_and_tag(), using libgit2."""
+	try:
+		repo = pygit2.Repository( path )
+		head = str( repo.head.target )
+		ref = repo.references.get( 'refs/tags/%s' % tag )
+		tagged = str( ref.peel( pygit2.Commit ).id ) if ref is not None else None
+		return head, tagged
+	except ( pygit2.GitError, ValueError ):
+		return None, None
+
+async def _rev_parse_head_and_tag( path, tag ):
+	"""Resolves HEAD and the commit of the tag with a single git call.
+	Returns both hashes, with None in place of the tag one if we do not
+	have the tag locally."""
+	if pygit2 is not None:
+		return await asyncio.to_thread( _rev_parse_head_and_tag_pygit2, path, tag )
+	# With --revs-only, git skips the tag instead of failing if it is missing.
+	ok, out = await run_command_async( [ "git", "rev-parse", "--revs-only", "HEAD", "refs/tags/%s^{}" % tag ], path )
+	hashes = out.split() if ok else []
+	head = hashes[ 0 ] if len( hashes ) > 0 else None
+	tagged = hashes[ 1 ] if len( hashes ) > 1 else None
+	return head, tagged
+
+async def git_checkout_version( artifact, version, do_install, mvn_threads = '1C', mvn_bin = 'mvn', force_build = False, log = sys.stdout ):
 	if version.endswith('SNAPSHOT'):
-		print( 'Not checking out SNAPSHOT version %s of module %s' % ( version, artifact ) )	
+		print( 'Not checking out SNAPSHOT version %s of module %s' % ( version, artifact ), file = log )
 		return True # That's ok.
 
-	path = os.path.join( ROOT_PATH, REPO_RELATIVE_PATH, artifact )
-	path = os.path.realpath( path )
-	# Git pull tags.
-	print('Getting tags from remote.')
-	ok, out = run_command( "git pull --tags", path )
+	path = artifact_path( artifact )
+	tag = '%s-%s' % ( artifact, version )
+	head, tagged = await _rev_parse_head_and_tag( path, tag )
+	if tagged is not None and head == tagged:
+		print( 'Version %s of module %s is already checked out' % ( version, artifact ), file = log )
+		_branch_cache[ artifact ] = tag
+		if do_install and force_build:
+			return await build_artifact( path, mvn_threads, mvn_bin, log )
+		return True
+
+	# Fetch the tag from the remote, unless we already have it.
+	if tagged is None:
+		print('Getting tag %s from remote.' % tag, file = log )
+		ok, out = await run_command_async( [ "git", "fetch", "--no-tags", "origin", "refs/tags/%s:refs/tags/%s" % ( tag, tag ) ], path, need_output = False )
+		if not ok:
+			# Some servers do not let us ask for a single ref.
+			ok, out = await run_command_async( [ "git", "fetch", "--tags" ], path, need_output = False )
 	# Now checkout the desired version.
-	print( 'Checking out version %s of module %s' % ( version, artifact ) )
-	ok, out = run_command( "git -c advice.detachedHead=false checkout %s-%s" % ( artifact, version ), path )
+	print( 'Checking out version %s of module %s' % ( version, artifact ), file = log )
+	ok, out = await run_command_async( [ "git", "-c", "advice.detachedHead=false", "checkout", tag ], path )
 	if not ok:
-		print('  Could not checkout specified version: %s' % out)
+		print('  Could not checkout specified version: %s' % out, file = log )
 		return False
+	_branch_cache[ artifact ] = tag
 	if do_install:
-		print('  Building artifact.' )
-		ok, out = run_command( "mvn clean install", path )
-		if not ok:
-			print('  Could not build artifact: %s' % out)
-			return False
+		return await build_artifact( path, mvn_threads, mvn_bin, log )
 	return True
 
-def get_branch_name( artifact ):
-	path = os.path.join( ROOT_PATH, REPO_RELATIVE_PATH, artifact )
-	path = os.path.realpath( path )
-	ok, out = run_command( "git status -uno", path )
-	branch_match = re.search( u"^On branch (.+)$", out, re.MULTILINE )
-	if branch_match is not None:
-		return branch_match.group( 1 )
+async def build_artifact( path, mvn_threads = '1C', mvn_bin = 'mvn', log = sys.stdout ):
+	print('  Building artifact.', file = log )
+	ok, out = await run_command_async( [ mvn_bin, "-B", "-q", "-T", mvn_threads, "clean", "install" ], path, stream = True )
+	if not ok:
+		print('  Could not build artifact, see the maven output above.', file = log )
+		return False
+	return True
+
+def _git_status_branch( artifact ):
+	path = artifact_path( artifact )
+	ok, status = asyncio.run( read_git_status( path ) )
+	if not ok:
+		return None
+	if status[ 'branch' ] is not None:
+		return status[ 'branch' ]
 	else:
-		tag_match = re.search( u"^HEAD detached at (.+)$", out, re.MULTILINE )
-		return tag_match.group( 1 )
+		return status[ 'tag' ]
+
+def get_branch_name( artifact ):
+	"""Returns the branch or tag the repo of the artifact is on, asking git
+	only if we do not know it already."""
+	return _branch_cache.get( artifact ) or _git_status_branch( artifact )
 
-def install( default_location = True ):
+def install( default_location = True, mvn_threads = '1C', mvn_bin = 'mvn' ):
 	if not default_location:
 		branch_name = get_branch_name( 'mastodon' )
 		t = datetime.date.today()
@@ -146,46 +419,115 @@ def install( default_location = True ):
 			target_dir = './Mastodon-%s-%s-all' % ( branch_name, t )
 		
 		target_dir = os.path.realpath( target_dir )
-		if not os.path.exists( target_dir ):
-			os.mkdir( target_dir )
+		os.makedirs( target_dir, exist_ok = True )
 		print( 'Installing to %s' % target_dir )
-		cmd = "mvn clean install -Dscijava.app.directory=%s" % os.path.abspath( target_dir )
+		cmd = [ mvn_bin, "-B", "-q", "-T", mvn_threads, "clean", "install", "-Dscijava.app.directory=%s" % target_dir ]
 	else:
 		print( 'Installing to default SciJava location' )
-		cmd = "mvn clean install"
+		cmd = [ mvn_bin, "-B", "-q", "-T", mvn_threads, "clean", "install" ]
 	# We need to build in the mastodon-app repo.
-	mastodon_app_path = os.path.join(REPO_RELATIVE_PATH, 'mastodon-app')
-	ok, out = run_command( cmd, mastodon_app_path )
+	ok, out = run_command( cmd, artifact_path( 'mastodon-app' ), stream = True )
 	if not ok:
-		print( 'Problem during install: %s' % out )
+		print( 'Problem during install, see the maven output above.' )
 		return False
 
 	if not default_location:
 		subcopy_mastodon_jar( target_dir )
 
+def _copy_file_range( src, dst ):
+	"""Copies src to dst within the kernel, without moving the bytes through
+	user space. Raises OSError if the platform or file system does not
+	support it."""
+	if not hasattr( os, 'copy_file_range' ):
+		raise OSError( 'copy_file_range is not available' )
+	with open( src, 'rb' ) as fsrc, open( dst, 'wb' ) as fdst:
+		remaining = os.fstat( fsrc.fileno() ).st_size
+		while remaining > 0:
+			copied = os.copy_file_range( fsrc.fileno(), fdst.fileno(), remaining )
+			if copied == 0:
+				raise OSError( 'copy_file_range stopped before the end of %s' % src )
+			remaining -= copied
+
+def copy_jar( src, dst ):
+	"""Hard-links src to dst, or copies it if they are not on the same
+	file system."""
+	# Never write through an older link to the file we copy from.
+	try:
+		os.remove( dst )
+	except FileNotFoundError:
+		pass
+	try:
+		os.link( src, dst )
+		return
+	except OSError:
+		pass
+	try:
+		_copy_file_range( src, dst )
+	except OSError:
+		shutil.copyfile( src, dst )
+
 def subcopy_mastodon_jar( target_dir ):
 	# Make a separate copy of just the mastodon jar if we have to.
 	copy_dir = target_dir[0:-4]
-	if not os.path.exists( copy_dir ):
-		os.mkdir( copy_dir )
-
-	
-	jars_dir = os.path.join( ROOT_PATH, target_dir, 'jars' )
-	print('Copying mastodon artifacts from %s to %s' % (jars_dir, target_dir) )
-	for file in glob.glob(  os.path.join(jars_dir, 'mastodon-*.jar') ):
-		print( '  Copying %s to %s ' % ( os.path.basename(os.path.normpath(file)), copy_dir ) )
-		shutil.copy( file, copy_dir )
-	print('Copying extra artifacts from %s to %s' % (jars_dir, target_dir) )
-	for extra in EXTRAS:
-		for file in glob.glob(  os.path.join(jars_dir, '%s-*.jar' % extra) ):
-			print( '  Copying %s to %s ' % ( os.path.basename(os.path.normpath(file)), copy_dir ) )
-			shutil.copy( file, copy_dir )
+	os.makedirs( copy_dir, exist_ok = True )
+
+	jars_dir = os.path.join( target_dir, 'jars' )
+	prefixes = ( 'mastodon-', ) + tuple( '%s-' % extra for extra in EXTRAS )
+	print('Copying mastodon and extra artifacts from %s to %s' % (jars_dir, target_dir) )
+	with ThreadPoolExecutor( max_workers = 8 ) as executor:
+		futures = []
+		with os.scandir( jars_dir ) as entries:
+			for entry in entries:
+				if entry.name.endswith( '.jar' ) and entry.name.startswith( prefixes ):
+					print( '  Copying %s to %s ' % ( entry.name, copy_dir ) )
+					futures.append( executor.submit( copy_jar, entry.path, os.path.join( copy_dir, entry.name ) ) )
+		done, _ = wait( futures )
+	# Raise the first copy error, if any.
+	for future in done:
+		future.result()
+
+async def run_for_artifacts( task, artifacts, parallel = True, stop_on_failure = True ):
+	"""Awaits task( artifact, log ) for each artifact and returns True if
+	all of them succeeded. In parallel mode the tasks run concurrently, and
+	the output of each is buffered and printed in one block once it is done,
+	so that the logs of different repos do not interleave."""
+	if not parallel:
+		all_ok = True
+		for artifact in artifacts:
+			if not await task( artifact, sys.stdout ):
+				all_ok = False
+				if stop_on_failure:
+					return False
+		return all_ok
+
+	async def run_one( artifact ):
+		log = io.StringIO()
+		ok = await task( artifact, log )
+		return ok, log
+
+	all_ok = True
+	pending = [ asyncio.ensure_future( run_one( artifact ) ) for artifact in artifacts ]
+	try:
+		for next_done in asyncio.as_completed( pending ):
+			ok, log = await next_done
+			print( log.getvalue(), end = '' )
+			if not ok:
+				all_ok = False
+				if stop_on_failure:
+					return False
+	finally:
+		# Cancel what is still running. A task busy with a git command lets
+		# it finish, but does not start another one.
+		for future in pending:
+			future.cancel()
+		await asyncio.gather( *pending, return_exceptions = True )
+	return all_ok
 
 #-----------------------
 # MAIN
 #-----------------------
 
-def run(install_to_default, is_preview, do_install, skip_up_to_date, skip_unstaged):
+def run(install_to_default, is_preview, do_install, skip_up_to_date, skip_unstaged, mvn_threads = '1C', mvn_bin = 'mvn', force_build = False):
 
 	if not is_preview:
 		# Read the desired version.
@@ -198,23 +540,26 @@ def run(install_to_default, is_preview, do_install, skip_up_to_date, skip_unstag
 		# Check each module.
 		print( '\n----------------' )
 		print( 'Checking repos for cleanliness' )
-		for artifact in ARTIFACTS:
-			if not check_if_clean( artifact, skip_up_to_date, skip_unstaged ):
-				return
+		if not asyncio.run( run_for_artifacts(
+				lambda artifact, log: check_if_clean( artifact, skip_up_to_date, skip_unstaged, log ),
+				ARTIFACTS ) ):
+			return
 
 		# Pull each module.
 		print( '\n-------------------' )
 		print( 'Checking out the specified versions:' )
-		for artifact in ARTIFACTS:
-			# git_pull( artifact )
-			version = get_artifact_version( artifact )
-			if not git_checkout_version( artifact, version, do_install ):
-				return
+		# Artifacts depend on each other, so if we build them we have to do
+		# it one after the other, in the order of ARTIFACTS.
+		if not asyncio.run( run_for_artifacts(
+				lambda artifact, log: git_checkout_version( artifact, get_artifact_version( artifact ), do_install, mvn_threads, mvn_bin, force_build, log ),
+				ARTIFACTS,
+				parallel = not do_install ) ):
+			return
 		print( 'Done.' )
 
 	print( '\n----------' )
 	print( 'Installing' )
-	install( install_to_default )
+	install( install_to_default, mvn_threads, mvn_bin )
 	print( 'Done.' )
 
 	if not is_preview:
@@ -222,10 +567,12 @@ def run(install_to_default, is_preview, do_install, skip_up_to_date, skip_unstag
 		# Go back to master.
 		print( '\n----------' )
 		print( 'Switching back to master branches' )
-		for artifact in ARTIFACTS:
-			ok = git_checkout_master( artifact )
+		async def checkout_master( artifact, log ):
+			ok = await git_checkout_master( artifact, log )
 			if ok:
-				print( ' %30s -> %s' % ( artifact, 'done.' ) )
+				print( ' %30s -> %s' % ( artifact, 'done.' ), file = log )
+			return ok
+		asyncio.run( run_for_artifacts( checkout_master, ARTIFACTS, stop_on_failure = False ) )
 
 	print( 'Install finished. ')
 
@@ -244,6 +591,10 @@ if __name__ == "__main__":
 		action='store_true', 
 		default=False,
 		help='If set, will build (by running maven install) each artifact after checking out the version. This is desirable if the versions tagged have not been built yet.')
+	parser.add_argument('--force-build',
+		action='store_true',
+		default=False,
+		help='If set together with --build, will also build the artifacts whose version was already checked out. Otherwise they are assumed to be built already.')
 	parser.add_argument('--skip-up-to-date', 
 		action='store_true', 
 		default=False,
@@ -252,6 +603,12 @@ if __name__ == "__main__":
 		action='store_true', 
 		default=False,
 		help='If set, will not stop if the local repo has uncommitted changes.')
+	parser.add_argument('--mvn-threads',
+		default='1C',
+		help='Number of threads maven uses to build modules in parallel, passed to its -T option. A value ending with C is a multiple of the number of CPU cores. Default: 1C.')
+	parser.add_argument('--mvn-bin',
+		default='mvn',
+		help='The maven executable to use. Set it to mvnd to build with the Maven Daemon (https://github.com/apache/maven-mvnd), which keeps a warm JVM between the builds of the different artifacts. Default: mvn.')
 	
 	args = parser.parse_args()
 
@@ -260,5 +617,8 @@ if __name__ == "__main__":
 	do_install = args.build
 	skip_up_to_date = args.skip_up_to_date
 	skip_unstaged = args.skip_unstaged
+	mvn_threads = args.mvn_threads
+	mvn_bin = args.mvn_bin
+	force_build = args.force_build
 
-	run(install_to_default, is_preview, do_install, skip_up_to_date, skip_unstaged)
+	run(install_to_default, is_preview, do_install, skip_up_to_date, skip_unstaged, mvn_threads, mvn_bin, force_build)